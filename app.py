@@ -7,7 +7,6 @@ Run with:  python -m smart_contract_assistant.app
 """
 
 import os
-import gradio as gr
 
 from smart_contract_assistant.config import (
     validate_api_key,
@@ -17,7 +16,7 @@ from smart_contract_assistant.config import (
     logger,
 )
 from smart_contract_assistant.ingestion import ingest_documents, save_index, load_index
-from smart_contract_assistant.rag_chain import build_rag_chain, query
+from smart_contract_assistant.rag_chain import build_rag_chain, stream_query
 
 
 # ── UI Callback Functions ──────────────────────────────────────────────────
@@ -48,22 +47,29 @@ def ui_ingest(files, state):
 
 
 def ui_query(message, history, state):
-    """Handles chat queries from the UI."""
+    """
+    Handles chat queries from the UI, yielding the reply as it streams in.
+    Yields (reply, state) so an index loaded from disk is kept in the
+    session state and reused (with its query cache) on later messages.
+    """
     if state is None:
         # Try loading from disk
         state = load_index()
 
     if state is None:
-        return "⚠️ Please upload and ingest documents first (Tab 1).", history
+        yield "⚠️ Please upload and ingest documents first (Tab 1).", state
+        return
 
     try:
         chain = build_rag_chain(state)
-        result = query(chain, message)
-        return result["formatted"], history
+        reply = ""
+        for piece in stream_query(chain, message):
+            reply += piece
+            yield reply, state
 
     except Exception as e:
         logger.error(f"Query error: {e}")
-        return f"❌ Error: {e}", history
+        yield f"❌ Error: {e}", state
 
 
 # ── Gradio App ─────────────────────────────────────────────────────────────
@@ -71,6 +77,9 @@ def ui_query(message, history, state):
 
 def create_ui():
     """Creates the Gradio Blocks interface."""
+    # Imported here so importing this module (e.g. for its callbacks) doesn't pull in Gradio
+    import gradio as gr
+
     with gr.Blocks(theme=gr.themes.Soft(), title="Smart Contract Assistant") as demo:
         # Shared state (replaces global variable)
         vs_state = gr.State(None)
@@ -109,10 +118,10 @@ def create_ui():
 
             def chat_handler(message, chat_history, state):
                 if not message.strip():
-                    return "", chat_history, state
-                bot_reply, _ = ui_query(message, chat_history, state)
-                chat_history = chat_history + [[message, bot_reply]]
-                return "", chat_history, state
+                    yield "", chat_history, state
+                    return
+                for bot_reply, state in ui_query(message, chat_history, state):
+                    yield "", chat_history + [[message, bot_reply]], state
 
             send_btn.click(
                 fn=chat_handler,
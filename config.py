@@ -43,16 +43,45 @@ CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
 SEPARATORS = ["\n\n", "\n", ".", " "]
 
+# ── Embedding Settings ─────────────────────────────────────────────────────
+EMBEDDING_BATCH_SIZE = 512   # texts per embeddings request
+EMBEDDING_CONCURRENCY = 8    # embeddings requests in flight during ingestion
+EMBEDDING_MAX_RETRIES = 6
+
+# ── Vector Index Settings ──────────────────────────────────────────────────
+HNSW_M = 64                  # graph neighbours per node
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+IVFPQ_MIN_VECTORS = 10_000   # corpora at least this large use compressed IVFPQ
+IVFPQ_NLIST = 256            # coarse clusters
+IVFPQ_M = 48                 # sub-quantizers (bytes per vector)
+IVFPQ_NBITS = 8
+IVFPQ_NPROBE = 8             # clusters visited per query
+IVFPQ_TRAIN_SIZE = 65_536    # max vectors sampled for training
+
 # ── Retriever Settings ─────────────────────────────────────────────────────
 RETRIEVER_K = 4
+RETRIEVER_FETCH_K = 20       # MMR candidates fetched before picking RETRIEVER_K
+RETRIEVER_LAMBDA_MULT = 0.5  # MMR relevance/diversity trade-off (1 = relevance only)
+RETRIEVAL_BATCH_SIZE = 16    # max concurrent server queries searched together
+RETRIEVAL_BATCH_WAIT = 0.02  # seconds to wait for a batch to fill
+
+# ── Query Cache Settings ───────────────────────────────────────────────────
+QUERY_CACHE_SIZE = 512       # answered questions kept in memory
 
 # ── Paths (all relative to this folder) ────────────────────────────────────
 FAISS_INDEX_PATH = str(PROJECT_ROOT / "faiss_index")
+EMBEDDING_CACHE_PATH = str(PROJECT_ROOT / ".emb_cache")
 
 # ── Server Settings ────────────────────────────────────────────────────────
 API_HOST = "localhost"
 API_PORT = 8000
+API_WORKERS = min(4, os.cpu_count() or 1)
 GRADIO_PORT = 8091
+# Per process: split the cores across API workers so they don't oversubscribe
+FAISS_NUM_THREADS = max(1, min(8, (os.cpu_count() or 1) // API_WORKERS))
+WARMUP_ON_STARTUP = True     # send one throwaway query before serving traffic
+WARMUP_TIMEOUT = 15.0        # seconds before startup gives up on the warm-up
 
 # ── System Prompt ──────────────────────────────────────────────────────────
 SYSTEM_PROMPT = (
@@ -3,7 +3,9 @@ Evaluation Pipeline.
 Provides basic metrics to evaluate RAG answer quality.
 """
 
-from typing import List, Dict, Any
+import re
+from functools import lru_cache
+from typing import List, Dict, Any, Tuple
 from smart_contract_assistant.config import logger
 
 
@@ -24,6 +26,12 @@ SAMPLE_TEST_CASES = [
 ]
 
 
+@lru_cache(maxsize=128)
+def _keyword_pattern(keywords: Tuple[str, ...]) -> "re.Pattern[str]":
+    """Compiles keywords into one case-insensitive alternation, scanned in a single pass."""
+    return re.compile("|".join(map(re.escape, keywords)), re.IGNORECASE)
+
+
 def evaluate_answer(answer: str, ground_truth_keywords: List[str]) -> bool:
     """
     Checks if the answer contains any of the expected keywords.
@@ -35,8 +43,9 @@ def evaluate_answer(answer: str, ground_truth_keywords: List[str]) -> bool:
     Returns:
         True if at least one keyword is found.
     """
-    answer_lower = answer.lower()
-    return any(kw.lower() in answer_lower for kw in ground_truth_keywords)
+    if not ground_truth_keywords:
+        return False
+    return _keyword_pattern(tuple(ground_truth_keywords)).search(answer) is not None
 
 
 def run_evaluation(chain, test_cases: List[Dict[str, Any]] = None) -> Dict[str, Any]:
@@ -57,11 +66,16 @@ def run_evaluation(chain, test_cases: List[Dict[str, Any]] = None) -> Dict[str,
     results = []
     passed = 0
 
-    for i, tc in enumerate(test_cases, 1):
+    # Run all test cases concurrently instead of one LLM call after another
+    responses = chain.batch(
+        [{"input": tc["question"]} for tc in test_cases],
+        config={"max_concurrency": max(len(test_cases), 1)},
+    )
+
+    for i, (tc, response) in enumerate(zip(test_cases, responses), 1):
         question = tc["question"]
         keywords = tc["keywords"]
 
-        response = chain.invoke({"input": question})
         answer = response.get("answer", "")
         is_pass = evaluate_answer(answer, keywords)
 
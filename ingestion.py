@@ -4,9 +4,20 @@ Loads documents from various file formats, splits them into chunks,
 generates embeddings, and stores them in a FAISS vector store.
 """
 
-from typing import List, Optional
+import os
+import hashlib
+import multiprocessing
+import pickle
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import lru_cache, partial
+from typing import Dict, List, Optional
 from pathlib import Path
 
+import faiss
+import numpy as np
 from langchain_community.document_loaders import (
     PyMuPDFLoader,
     TextLoader,
@@ -14,15 +25,38 @@ from langchain_community.document_loaders import (
 )
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
+from langchain_core.embeddings import Embeddings
+from langchain_core.stores import InMemoryStore
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_core.documents import Document
 
+try:  # langchain v0.3.x
+    from langchain.embeddings import CacheBackedEmbeddings
+    from langchain.storage import LocalFileStore
+except ImportError:  # langchain v1.x+
+    from langchain_classic.embeddings import CacheBackedEmbeddings
+    from langchain_classic.storage import LocalFileStore
+
 from smart_contract_assistant.config import (
     EMBEDDING_MODEL,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_CONCURRENCY,
+    EMBEDDING_MAX_RETRIES,
+    HNSW_M,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_SEARCH,
+    IVFPQ_MIN_VECTORS,
+    IVFPQ_NLIST,
+    IVFPQ_M,
+    IVFPQ_NBITS,
+    IVFPQ_NPROBE,
+    IVFPQ_TRAIN_SIZE,
     CHUNK_SIZE,
     CHUNK_OVERLAP,
     SEPARATORS,
     FAISS_INDEX_PATH,
+    EMBEDDING_CACHE_PATH,
     logger,
 )
 
@@ -41,9 +75,32 @@ def _get_loader(file_path: str):
     return loader_cls(file_path)
 
 
-def _get_embeddings() -> OpenAIEmbeddings:
-    """Returns the configured OpenAI embeddings model."""
-    return OpenAIEmbeddings(model=EMBEDDING_MODEL)
+def _load_one(file_path: str) -> List[Document]:
+    """Loads a single file. Top-level so it can run in a worker process."""
+    return _get_loader(file_path).load()
+
+
+@lru_cache(maxsize=1)
+def _get_embeddings() -> Embeddings:
+    """
+    Returns the configured OpenAI embeddings model, wrapped in a cache.
+    Document vectors are cached on disk and query vectors in memory, so
+    repeated texts and questions skip the embeddings API.
+    Cached so the OpenAI client and its HTTP connection pool are reused across calls.
+    """
+    underlying = OpenAIEmbeddings(
+        model=EMBEDDING_MODEL,
+        chunk_size=EMBEDDING_BATCH_SIZE,
+        max_retries=EMBEDDING_MAX_RETRIES,
+        show_progress_bar=False,
+    )
+    return CacheBackedEmbeddings.from_bytes_store(
+        underlying,
+        LocalFileStore(EMBEDDING_CACHE_PATH),
+        namespace=EMBEDDING_MODEL,
+        query_embedding_cache=InMemoryStore(),
+        key_encoder="blake2b",
+    )
 
 
 def _get_text_splitter() -> RecursiveCharacterTextSplitter:
@@ -55,6 +112,81 @@ def _get_text_splitter() -> RecursiveCharacterTextSplitter:
     )
 
 
+def _deduplicate_chunks(chunks: List[Document]) -> List[Document]:
+    """
+    Drops chunks whose text already appeared (e.g. shared boilerplate).
+    The kept chunk records the other locations under 'duplicate_sources'.
+    """
+    unique: Dict[bytes, Document] = {}
+    for chunk in chunks:
+        digest = hashlib.blake2b(chunk.page_content.encode(), digest_size=16).digest()
+        kept = unique.get(digest)
+        if kept is None:
+            unique[digest] = chunk
+        else:
+            kept.metadata.setdefault("duplicate_sources", []).append({
+                "source": chunk.metadata.get("source"),
+                "page": chunk.metadata.get("page"),
+            })
+    return list(unique.values())
+
+
+def _embed_texts(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    """
+    Embeds texts in batches, keeping up to EMBEDDING_CONCURRENCY requests in flight.
+    Uses threads over the shared sync client: its connection pool outlives any
+    one call, whereas a per-call event loop would strand pooled async connections.
+    """
+    batches = [
+        texts[i:i + EMBEDDING_BATCH_SIZE]
+        for i in range(0, len(texts), EMBEDDING_BATCH_SIZE)
+    ]
+    with ThreadPoolExecutor(max_workers=EMBEDDING_CONCURRENCY) as executor:
+        results = executor.map(embeddings.embed_documents, batches)
+        return [vector for batch in results for vector in batch]
+
+
+def _build_index(vectors: np.ndarray) -> "faiss.Index":
+    """
+    Returns an empty index suited to the corpus size, trained if needed.
+    Large corpora get an IVFPQ index (48-byte codes instead of raw floats);
+    smaller ones get HNSW, as IVFPQ needs enough vectors to train on.
+    """
+    num_vectors, dimension = vectors.shape
+
+    if num_vectors >= IVFPQ_MIN_VECTORS and dimension % IVFPQ_M == 0:
+        quantizer = faiss.IndexFlatL2(dimension)
+        index = faiss.IndexIVFPQ(quantizer, dimension, IVFPQ_NLIST, IVFPQ_M, IVFPQ_NBITS)
+        sample_size = min(num_vectors, IVFPQ_TRAIN_SIZE)
+        sample = np.random.default_rng(0).choice(num_vectors, sample_size, replace=False)
+        index.train(vectors[sample])
+        index.nprobe = IVFPQ_NPROBE
+        index.make_direct_map()  # lets MMR reconstruct candidate vectors
+        return index
+
+    index = faiss.IndexHNSWFlat(dimension, HNSW_M)
+    index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    index.hnsw.efSearch = HNSW_EF_SEARCH
+    return index
+
+
+def _build_vectorstore(
+    embeddings: Embeddings,
+    texts: List[str],
+    vectors: List[List[float]],
+    metadatas: List[dict],
+) -> FAISS:
+    """Builds a FAISS vector store over precomputed embeddings."""
+    vectorstore = FAISS(
+        embedding_function=embeddings,
+        index=_build_index(np.asarray(vectors, dtype=np.float32)),
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={},
+    )
+    vectorstore.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas)
+    return vectorstore
+
+
 # ── Public Functions ───────────────────────────────────────────────────────
 
 
@@ -73,14 +205,27 @@ def ingest_documents(file_paths: List[str]) -> Optional[FAISS]:
         return None
 
     all_docs: List[Document] = []
-    for path in file_paths:
-        try:
-            loader = _get_loader(path)
-            docs = loader.load()
-            all_docs.extend(docs)
-            logger.info(f"Loaded {len(docs)} pages from: {Path(path).name}")
-        except Exception as e:
-            logger.error(f"Failed to load {path}: {e}")
+    with ExitStack() as stack:
+        if len(file_paths) == 1:
+            # A single file isn't worth a process pool's startup cost
+            pending = [(file_paths[0], partial(_load_one, file_paths[0]))]
+        else:
+            # Parse files in parallel worker processes (parsing is CPU-bound).
+            # "spawn" avoids forking a multi-threaded caller (e.g. Gradio
+            # workers), which can deadlock on locks held by other threads.
+            executor = stack.enter_context(ProcessPoolExecutor(
+                max_workers=min(len(file_paths), os.cpu_count() or 1),
+                mp_context=multiprocessing.get_context("spawn"),
+            ))
+            pending = [(path, executor.submit(_load_one, path).result) for path in file_paths]
+
+        for path, load in pending:
+            try:
+                docs = load()
+                all_docs.extend(docs)
+                logger.info(f"Loaded {len(docs)} pages from: {Path(path).name}")
+            except Exception as e:
+                logger.error(f"Failed to load {path}: {e}")
 
     if not all_docs:
         logger.error("No documents were successfully loaded.")
@@ -90,31 +235,81 @@ def ingest_documents(file_paths: List[str]) -> Optional[FAISS]:
     chunks = splitter.split_documents(all_docs)
     logger.info(f"Split into {len(chunks)} chunks.")
 
+    unique_chunks = _deduplicate_chunks(chunks)
+    if len(unique_chunks) < len(chunks):
+        logger.info(f"Dropped {len(chunks) - len(unique_chunks)} duplicate chunks.")
+    chunks = unique_chunks
+
     embeddings = _get_embeddings()
-    vectorstore = FAISS.from_documents(chunks, embeddings)
+    texts = [chunk.page_content for chunk in chunks]
+    vectors = _embed_texts(embeddings, texts)
+    vectorstore = _build_vectorstore(
+        embeddings, texts, vectors, [chunk.metadata for chunk in chunks]
+    )
     logger.info(f"Created FAISS index with {len(chunks)} vectors.")
 
     return vectorstore
 
 
+def _read_index_mmap(index_path: str) -> "faiss.Index":
+    """
+    Reads a FAISS index memory-mapped and read-only.
+    IO_FLAG_MMAP maps IVF inverted lists; IO_FLAG_MMAP_IFC (newer faiss)
+    maps flat code storage such as HNSW's. faiss rejects the combination
+    on IVF indexes, so those are re-read with IO_FLAG_MMAP alone.
+    """
+    io_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    if hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+        try:
+            return faiss.read_index(index_path, io_flags | faiss.IO_FLAG_MMAP_IFC)
+        except RuntimeError as e:
+            logger.debug(f"Retrying index read without IO_FLAG_MMAP_IFC: {e}")
+    return faiss.read_index(index_path, io_flags)
+
+
 def save_index(vectorstore: FAISS, path: str = FAISS_INDEX_PATH) -> None:
-    """Saves the FAISS index to disk."""
-    vectorstore.save_local(path)
+    """
+    Saves the FAISS index to disk, then reads it back to verify it loads.
+    Files are written to a temporary directory and renamed into place, so
+    processes that have the previous index memory-mapped keep reading the
+    old inode instead of a truncated file (which would crash them).
+
+    Raises:
+        RuntimeError: If the saved index cannot be loaded again.
+    """
+    target = Path(path)
+    target.mkdir(parents=True, exist_ok=True)
+    # Same parent directory -> same filesystem, so os.replace is an atomic rename
+    tmp_dir = tempfile.mkdtemp(prefix=f".{target.name}.", dir=target.parent)
+    try:
+        vectorstore.save_local(tmp_dir)
+        for name in ("index.faiss", "index.pkl"):
+            os.replace(Path(tmp_dir) / name, target / name)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    loaded = load_index(path)
+    if loaded is None or loaded.index.ntotal != vectorstore.index.ntotal:
+        raise RuntimeError(f"FAISS index saved to {path} could not be loaded back.")
     logger.info(f"FAISS index saved to: {path}")
 
 
 def load_index(path: str = FAISS_INDEX_PATH) -> Optional[FAISS]:
     """
     Loads an existing FAISS index from disk.
+    The index file is memory-mapped read-only: IVF inverted lists, or flat
+    vector storage (e.g. HNSW) where faiss supports IO_FLAG_MMAP_IFC.
+    Mapped data is paged in on demand instead of being copied into RAM.
 
     Returns:
         FAISS vector store, or None if not found.
     """
     try:
         embeddings = _get_embeddings()
-        vectorstore = FAISS.load_local(
-            path, embeddings, allow_dangerous_deserialization=True
-        )
+        index = _read_index_mmap(str(Path(path) / "index.faiss"))
+        with open(Path(path) / "index.pkl", "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        vectorstore = FAISS(embeddings, index, docstore, index_to_docstore_id)
         logger.info(f"Loaded FAISS index from: {path}")
         return vectorstore
     except Exception as e:
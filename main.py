@@ -45,7 +45,7 @@ def cmd_ingest(args):
 def cmd_serve(args):
     """Start the LangServe API server."""
     import uvicorn
-    from smart_contract_assistant.config import API_HOST, API_PORT
+    from smart_contract_assistant.config import API_HOST, API_PORT, API_WORKERS
 
     print(f"🚀 Starting API server at http://{API_HOST}:{API_PORT}")
     print(f"📄 API docs:   http://{API_HOST}:{API_PORT}/docs")
@@ -55,6 +55,7 @@ def cmd_serve(args):
         "smart_contract_assistant.server:app",
         host=API_HOST,
         port=API_PORT,
+        workers=API_WORKERS,
         reload=False,
     )
 
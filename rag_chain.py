@@ -7,43 +7,75 @@ Compatible with langchain v0.3.x and v1.x+
 """
 
 import os
-from typing import Dict, Any, List
+import itertools
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, AsyncIterator, Iterator, List, Optional, Tuple
 from operator import itemgetter
 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough, RunnableLambda
 from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
 from langchain_openai import ChatOpenAI
 from langchain_community.vectorstores import FAISS
 
 from smart_contract_assistant.config import (
     CHAT_MODEL,
     RETRIEVER_K,
+    RETRIEVER_FETCH_K,
+    RETRIEVER_LAMBDA_MULT,
+    QUERY_CACHE_SIZE,
     SYSTEM_PROMPT,
     logger,
 )
 
 
+# ── Query Cache ────────────────────────────────────────────────────────────
+# Keyed on (cache epoch, normalized question). Each vector store gets a new
+# epoch the first time a chain is built for it, so reloading or re-ingesting
+# an index never serves answers from the previous one.
+_cache_epochs = itertools.count()
+_query_cache: "OrderedDict[Tuple[int, str], Dict[str, Any]]" = OrderedDict()
+_query_cache_lock = threading.Lock()
+
+
+_DOC_SEPARATOR = "\n\n"
+
+
 def _format_docs(docs: List[Document]) -> str:
     """Formats retrieved documents into a single context string."""
-    return "\n\n".join(doc.page_content for doc in docs)
+    # A list (not a generator) lets str.join size the result in one pass
+    return _DOC_SEPARATOR.join([doc.page_content for doc in docs])
 
 
-def build_rag_chain(vectorstore: FAISS):
+def build_rag_chain(vectorstore: FAISS, retriever: Optional[BaseRetriever] = None):
     """
     Creates a RAG chain that returns the answer and source documents.
-    Uses langchain_core runnables for broad version compatibility.
+    Uses langchain_core runnables for broad version compatibility; being
+    pure LCEL, the chain supports batch(), astream() and tracing natively.
 
     Args:
         vectorstore: FAISS vector store to retrieve from.
+        retriever: Optional retriever over the same vector store, used
+                   instead of the default MMR retriever.
 
     Returns:
         A callable chain that accepts {"input": str} and returns
-        {"input", "context", "answer"}.
+        {"input", "context", "answer"}. Streaming the chain yields the
+        retrieved context first, then the answer token by token.
     """
     llm = ChatOpenAI(model=CHAT_MODEL, temperature=0)
-    retriever = vectorstore.as_retriever(search_kwargs={"k": RETRIEVER_K})
+    if retriever is None:
+        retriever = vectorstore.as_retriever(
+            search_type="mmr",
+            search_kwargs={
+                "k": RETRIEVER_K,
+                "fetch_k": RETRIEVER_FETCH_K,
+                "lambda_mult": RETRIEVER_LAMBDA_MULT,
+            },
+        )
 
     prompt = ChatPromptTemplate.from_messages([
         ("system", SYSTEM_PROMPT),
@@ -55,34 +87,93 @@ def build_rag_chain(vectorstore: FAISS):
     # Step 2: Format docs into context string
     # Step 3: Pass context + input to LLM
     # Step 4: Parse output
+    answer_chain = (
+        {
+            "context": itemgetter("context") | RunnableLambda(_format_docs),
+            "input": itemgetter("input"),
+        }
+        | prompt
+        | llm
+        | StrOutputParser()
+    )
+
+    chain = RunnablePassthrough.assign(
+        context=itemgetter("input") | retriever,
+    ).assign(answer=answer_chain)
 
-    def _chain_fn(inputs: Dict[str, Any]) -> Dict[str, Any]:
-        question = inputs["input"]
+    epoch = getattr(vectorstore, "_cache_epoch", None)
+    if epoch is None:
+        epoch = next(_cache_epochs)
+        vectorstore._cache_epoch = epoch
+    chain._cache_epoch = epoch
 
-        # Retrieve relevant documents
-        docs = retriever.invoke(question)
+    logger.info(f"RAG chain built (model={CHAT_MODEL}, k={RETRIEVER_K}).")
+    return chain
 
-        # Format context
-        context_str = _format_docs(docs)
 
-        # Generate answer
-        messages = prompt.invoke({"context": context_str, "input": question})
-        response = llm.invoke(messages)
-        answer = response.content
+def _cache_key(chain, question: str) -> Tuple[int, str]:
+    """Returns the query cache key for a question asked of the given chain."""
+    return (getattr(chain, "_cache_epoch", id(chain)), question.strip().lower())
 
-        return {
-            "input": question,
-            "context": docs,
-            "answer": answer,
-        }
 
-    logger.info(f"RAG chain built (model={CHAT_MODEL}, k={RETRIEVER_K}).")
-    return RunnableLambda(_chain_fn)
+def _cache_get(key: Tuple[int, str]):
+    """Returns a copy of a cached query result, or None on a miss."""
+    with _query_cache_lock:
+        cached = _query_cache.get(key)
+        if cached is None:
+            return None
+        _query_cache.move_to_end(key)
+        return {**cached, "sources": list(cached["sources"])}
+
+
+def _cache_put(key: Tuple[int, str], result: Dict[str, Any]) -> None:
+    """Stores a query result, evicting the least recently used entries."""
+    with _query_cache_lock:
+        _query_cache[key] = {**result, "sources": list(result["sources"])}
+        while len(_query_cache) > QUERY_CACHE_SIZE:
+            _query_cache.popitem(last=False)
+
+
+def _collect_sources(docs: List[Document]) -> List[str]:
+    """
+    Extracts unique citation strings from retrieved documents, in retrieval order.
+    Locations of identical chunks dropped at ingestion ('duplicate_sources')
+    are cited right after the chunk that was kept.
+    """
+    seen = set()
+    sources = []
+    for doc in docs:
+        locations = [doc.metadata] + doc.metadata.get("duplicate_sources", [])
+        for location in locations:
+            source_file = location.get("source") or "Unknown"
+            page = location.get("page")
+            if page is None:
+                page = "N/A"
+            key = (source_file, page)
+            if key in seen:
+                continue
+            seen.add(key)
+            sources.append(f"- {os.path.basename(source_file)} (Page {page})")
+
+    return sources
+
+
+def _format_result(answer: str, sources: List[str]) -> Dict[str, Any]:
+    """Builds the query result dict, including the display string."""
+    formatted = f"{answer}\n\n**Sources:**\n" + "\n".join(sources)
+
+    return {
+        "answer": answer,
+        "sources": sources,
+        "formatted": formatted,
+    }
 
 
 def query(chain, question: str) -> Dict[str, Any]:
     """
     Runs a question through the RAG chain and formats the result.
+    Results are cached per vector store, so repeated questions skip
+    both retrieval and generation.
 
     Args:
         chain: The RAG chain to invoke.
@@ -91,24 +182,81 @@ def query(chain, question: str) -> Dict[str, Any]:
     Returns:
         Dict with 'answer', 'sources' (list), and 'formatted' (display string).
     """
+    key = _cache_key(chain, question)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
     response = chain.invoke({"input": question})
 
     answer = response.get("answer", "No answer generated.")
+    result = _format_result(answer, _collect_sources(response.get("context", [])))
 
-    # Extract and deduplicate sources
-    sources = []
-    for doc in response.get("context", []):
-        source_file = doc.metadata.get("source", "Unknown")
-        page = doc.metadata.get("page", "N/A")
-        source_str = f"- {os.path.basename(source_file)} (Page {page})"
-        sources.append(source_str)
+    _cache_put(key, result)
+    return result
 
-    unique_sources = list(set(sources))
 
-    formatted = f"{answer}\n\n**Sources:**\n" + "\n".join(unique_sources)
+def _read_chunk(chunk: Dict[str, Any], tokens: List[str], docs: List[Document]) -> Optional[str]:
+    """Records a streamed chain chunk; returns its answer token, if any."""
+    if "context" in chunk:
+        docs[:] = chunk["context"]
+    token = chunk.get("answer")
+    if token:
+        tokens.append(token)
+    return token or None
 
-    return {
-        "answer": answer,
-        "sources": unique_sources,
-        "formatted": formatted,
-    }
+
+def _finish_stream(key: Tuple[int, str], tokens: List[str], docs: List[Document]) -> List[str]:
+    """
+    Caches the result of a finished stream and returns the pieces still to
+    yield: the fallback answer if no tokens arrived, then the sources block.
+    """
+    answer = "".join(tokens) or "No answer generated."
+    result = _format_result(answer, _collect_sources(docs))
+    _cache_put(key, result)
+
+    tail = result["formatted"][len(answer):]
+    return [tail] if tokens else [answer, tail]
+
+
+def stream_query(chain, question: str) -> Iterator[str]:
+    """
+    Streams a question through the RAG chain.
+
+    Yields answer tokens as they are generated, followed by the sources
+    block, so the concatenated output equals query()'s 'formatted' string.
+    Cached results are yielded in one piece.
+    """
+    key = _cache_key(chain, question)
+    cached = _cache_get(key)
+    if cached is not None:
+        yield cached["formatted"]
+        return
+
+    tokens: List[str] = []
+    docs: List[Document] = []
+    for chunk in chain.stream({"input": question}):
+        token = _read_chunk(chunk, tokens, docs)
+        if token:
+            yield token
+
+    yield from _finish_stream(key, tokens, docs)
+
+
+async def astream_query(chain, question: str) -> AsyncIterator[str]:
+    """Async version of stream_query()."""
+    key = _cache_key(chain, question)
+    cached = _cache_get(key)
+    if cached is not None:
+        yield cached["formatted"]
+        return
+
+    tokens: List[str] = []
+    docs: List[Document] = []
+    async for chunk in chain.astream({"input": question}):
+        token = _read_chunk(chunk, tokens, docs)
+        if token:
+            yield token
+
+    for piece in _finish_stream(key, tokens, docs):
+        yield piece
@@ -6,35 +6,200 @@ Run with:  python -m smart_contract_assistant.server
        or: python main.py serve
 """
 
+import json
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
 from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from langserve import add_routes
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from pydantic import PrivateAttr
 
 from smart_contract_assistant.config import (
     validate_api_key,
     API_HOST,
     API_PORT,
+    RETRIEVER_K,
+    RETRIEVER_FETCH_K,
+    RETRIEVER_LAMBDA_MULT,
+    RETRIEVAL_BATCH_SIZE,
+    RETRIEVAL_BATCH_WAIT,
+    FAISS_NUM_THREADS,
+    WARMUP_ON_STARTUP,
+    WARMUP_TIMEOUT,
     logger,
 )
 from smart_contract_assistant.ingestion import load_or_create_empty_index
-from smart_contract_assistant.rag_chain import build_rag_chain
+from smart_contract_assistant.rag_chain import build_rag_chain, astream_query
+
+
+class BatchedRetriever(BaseRetriever):
+    """
+    Retriever that coalesces concurrent async queries.
+    Pending questions are embedded with one API call and searched with a
+    single FAISS query matrix, once the batch is full or the wait expires.
+    Each question's candidates are then re-ranked with MMR for diversity.
+    """
+
+    vectorstore: FAISS
+    k: int = RETRIEVER_K
+    fetch_k: int = RETRIEVER_FETCH_K
+    lambda_mult: float = RETRIEVER_LAMBDA_MULT
+    max_batch_size: int = RETRIEVAL_BATCH_SIZE
+    max_wait: float = RETRIEVAL_BATCH_WAIT
+
+    _queue: Optional[asyncio.Queue] = PrivateAttr(default=None)
+    _worker: Optional[asyncio.Task] = PrivateAttr(default=None)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.vectorstore.max_marginal_relevance_search(
+            query, k=self.k, fetch_k=self.fetch_k, lambda_mult=self.lambda_mult
+        )
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+        future = loop.create_future()
+        await self._queue.put((query, future))
+        return await future
+
+    async def _run(self) -> None:
+        """Background task: collects pending queries and resolves them in batches."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch: List[Tuple[str, asyncio.Future]] = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                results = await self._search_batch([q for q, _ in batch])
+            except Exception as e:
+                logger.error(f"Batched retrieval failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), docs in zip(batch, results):
+                if not future.done():
+                    future.set_result(docs)
+
+    async def _aembed_questions(self, questions: List[str]) -> List[List[float]]:
+        """
+        Embeds questions, consulting the in-memory query cache first.
+        Misses are embedded with one call to the underlying model, so query
+        vectors never reach the on-disk document embedding cache.
+        """
+        embeddings = self.vectorstore.embeddings
+        underlying = getattr(embeddings, "underlying_embeddings", embeddings)
+        query_store = getattr(embeddings, "query_embedding_store", None)
+        if query_store is None:
+            return await underlying.aembed_documents(questions)
+
+        vectors = await query_store.amget(questions)
+        misses = [i for i, vector in enumerate(vectors) if vector is None]
+        if misses:
+            miss_texts = [questions[i] for i in misses]
+            new_vectors = await underlying.aembed_documents(miss_texts)
+            await query_store.amset(list(zip(miss_texts, new_vectors)))
+            for i, vector in zip(misses, new_vectors):
+                vectors[i] = vector
+        return vectors
+
+    async def _search_batch(self, questions: List[str]) -> List[List[Document]]:
+        """Embeds all questions at once and runs one FAISS search over them."""
+        vectors = await self._aembed_questions(questions)
+        query_matrix = np.asarray(vectors, dtype=np.float32)
+        return await asyncio.to_thread(self._search_vectors, query_matrix)
+
+    def _search_vectors(self, query_matrix: np.ndarray) -> List[List[Document]]:
+        """Fetches fetch_k candidates per query in one search, then picks k by MMR."""
+        store = self.vectorstore
+        _, indices = store.index.search(query_matrix, self.fetch_k)
+
+        results = []
+        for query_vector, row in zip(query_matrix, indices):
+            candidates = [int(i) for i in row if i != -1]
+            selected = maximal_marginal_relevance(
+                query_vector,
+                [store.index.reconstruct(i) for i in candidates],
+                lambda_mult=self.lambda_mult,
+                k=self.k,
+            )
+            results.append([
+                store.docstore.search(store.index_to_docstore_id[candidates[j]])
+                for j in selected
+            ])
+        return results
+
+
+async def _warm_up(chain) -> None:
+    """
+    Sends one throwaway query through the chain, so the first real request
+    finds warm OpenAI connections and an initialized FAISS search path.
+    Bounded by WARMUP_TIMEOUT so a slow or unreachable API can't stall startup.
+    """
+    try:
+        await asyncio.wait_for(chain.ainvoke({"input": "warmup"}), timeout=WARMUP_TIMEOUT)
+        logger.info("Warm-up query completed.")
+    except asyncio.TimeoutError:
+        logger.warning(f"Warm-up query timed out after {WARMUP_TIMEOUT:.0f}s; serving anyway.")
+    except Exception as e:
+        logger.warning(f"Warm-up query failed: {e}")
 
 
 def create_app() -> FastAPI:
     """Creates and configures the FastAPI application."""
     validate_api_key()
 
+    # Cap FAISS's OpenMP pool so concurrent searches don't oversubscribe cores
+    faiss.omp_set_num_threads(FAISS_NUM_THREADS)
+
     # Load vector store
     vectorstore = load_or_create_empty_index()
 
-    # Build RAG chain
-    chain = build_rag_chain(vectorstore)
+    # Build RAG chain (concurrent requests share batched retrieval)
+    retriever = BatchedRetriever(vectorstore=vectorstore)
+    chain = build_rag_chain(vectorstore, retriever=retriever)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # Runs on the server's event loop, so the async clients get warmed
+        if WARMUP_ON_STARTUP:
+            await _warm_up(chain)
+        yield
 
     # Create FastAPI app
     app = FastAPI(
         title="Smart Contract Analysis API",
         version="2.0",
         description="RAG-based Smart Contract Analysis API powered by LangChain & OpenAI",
+        lifespan=lifespan,
     )
 
     # Add CORS middleware
@@ -48,6 +213,8 @@ def create_app() -> FastAPI:
 
     # Add LangServe routes
     try:
+        from langserve import add_routes
+
         add_routes(app, chain, path="/contract-assistant")
         logger.info("LangServe routes added at /contract-assistant")
     except Exception as e:
@@ -60,10 +227,45 @@ def create_app() -> FastAPI:
         class QueryRequest(BaseModel):
             input: str
 
-        @app.post("/contract-assistant/invoke")
+        # Typed response models let FastAPI serialize via pydantic-core directly
+        class ContextEntry(BaseModel):
+            source: Optional[str] = None
+            page: Any = None
+            duplicate_sources: List[Dict[str, Any]] = []
+
+        class ChainOutput(BaseModel):
+            input: str
+            context: List[ContextEntry]
+            answer: str
+
+        class QueryResponse(BaseModel):
+            output: ChainOutput
+
+        @app.post("/contract-assistant/invoke", response_model=QueryResponse)
         async def invoke_chain(request: QueryRequest):
-            result = chain.invoke({"input": request.input})
-            return {"output": result}
+            result = await chain.ainvoke({"input": request.input})
+            # Return citations only; full page_content would bloat every response
+            context = [
+                ContextEntry(
+                    source=doc.metadata.get("source"),
+                    page=doc.metadata.get("page"),
+                    duplicate_sources=doc.metadata.get("duplicate_sources", []),
+                )
+                for doc in result.get("context", [])
+            ]
+            return QueryResponse(output=ChainOutput(
+                input=result["input"],
+                context=context,
+                answer=result.get("answer", ""),
+            ))
+
+        @app.post("/contract-assistant/stream")
+        async def stream_chain(request: QueryRequest):
+            async def _events():
+                async for token in astream_query(chain, request.input):
+                    yield f"data: {json.dumps(token)}\n\n"
+
+            return StreamingResponse(_events(), media_type="text/event-stream")
 
     logger.info("FastAPI app created successfully.")
     return app